@@ -0,0 +1,394 @@
+# Cultural Singletons
+# Measure ingest throughput on synthetic dumps
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import os
+import bz2
+import sys
+import json
+import time
+import codecs
+import socket
+import argparse
+import resource
+import multiprocessing
+
+# Third party imports
+import bson
+
+# Local imports
+import synthetic_dumps
+import dumpfile
+from dumpfile import read_pages
+import process_linkdata
+import process_wikidata
+from linkindex import LinkIndexWriter
+from bulkwriter import compact_doc
+
+# Benchmark config
+data_dir = '../data'
+# Scratch database for the 'db' stage with --mongo
+benchmark_db_name = 'singletons_benchmark'
+stages = ['xml', 'json', 'links', 'db', 'classify']
+
+def synthetic_wikidata(page_count, max_links=20):
+    '''Returns the path to a synthetic wikidata dump, creating it if needed.'''
+    path = os.path.join(data_dir, 'synthetic-wikidatawiki-%d.xml' % page_count)
+    if max_links != 20:
+        path = path.replace('.xml', '-links%d.xml' % max_links)
+    if not os.path.exists(path):
+        print "Generating %s" % path
+        synthetic_dumps.write_wikidata_dump(path, page_count, max_links=max_links)
+    return path
+
+def synthetic_wikipedia(page_count, mean_length=3000, titles=None):
+    '''Returns the path to a synthetic eswiki dump, creating it if needed.'''
+    path = os.path.join(data_dir, 'synthetic-eswiki-%d.xml' % page_count)
+    if mean_length != 3000:
+        path = path.replace('.xml', '-length%d.xml' % mean_length)
+    if titles is not None:
+        path = path.replace('.xml', '-linked.xml')
+    if not os.path.exists(path):
+        print "Generating %s" % path
+        synthetic_dumps.write_wikipedia_dump(path, page_count
+            , mean_length=mean_length, titles=titles)
+    return path
+
+def synthetic_index(wikidata_path):
+    '''Returns the path to a link index of a synthetic wikidata dump, creating it if needed.'''
+    index_path = wikidata_path + '.idx'
+    if not os.path.exists(index_path):
+        index = LinkIndexWriter(index_path)
+        for entity, text in read_texts(wikidata_path):
+            record, links = process_linkdata.parse_page(entity, text)
+            for link in links:
+                index.add(link['language'], link['title'], link['sitelinks']
+                    , link['disambiguation'])
+        index.close()
+    return index_path
+
+def compress_dump(path, bz2_path):
+    '''Writes a multistream bz2 copy of a dump, one stream per piece_size bytes.'''
+    with open(path, 'rb') as f:
+        with open(bz2_path, 'wb') as out:
+            while True:
+                data = f.read(dumpfile.piece_size)
+                if not data:
+                    break
+                out.write(bz2.compress(data))
+
+def read_texts(path):
+    '''Returns the (title, text) of every page in a dump.'''
+    with open(path, 'rb') as f:
+        return [(page.title, page.text) for page in read_pages(f)]
+
+def peak_rss():
+    '''Returns the peak resident set size of this process in kB.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def timed(pages, run):
+    '''Times run(), which returns the number of links it handled.'''
+    start = time.time()
+    links = run() or 0
+    elapsed = max(time.time() - start, 0.000001)
+    return {'pages':pages, 'links':links, 'seconds':elapsed
+        , 'pages_per_sec':pages / elapsed, 'links_per_sec':links / elapsed}
+
+def stage_xml(config):
+    '''Parses the wikidata dump without decoding the page json.'''
+    path = synthetic_wikidata(config['pages'], config['max_links'])
+    def run():
+        with open(path, 'rb') as f:
+            for page in read_pages(f):
+                pass
+    return timed(config['pages'], run)
+
+def stage_json(config):
+    '''Decodes the json of every wikidata page.'''
+    texts = read_texts(synthetic_wikidata(config['pages'], config['max_links']))
+    def run():
+        links = 0
+        for entity, text in texts:
+            sitelinks, disambiguation = process_linkdata.decode_page(text)
+            links += len(sitelinks)
+        return links
+    return timed(len(texts), run)
+
+def stage_links(config):
+    '''Decodes wikidata pages and builds the link objects.'''
+    texts = read_texts(synthetic_wikidata(config['pages'], config['max_links']))
+    def run():
+        links = 0
+        for entity, text in texts:
+            links += len(process_linkdata.parse_page(entity, text)[1])
+        return links
+    return timed(len(texts), run)
+
+def stage_db(config):
+    '''Writes link batches to mongod, or encodes them as BSON without one.'''
+    texts = read_texts(synthetic_wikidata(config['pages'], config['max_links']))
+    batches = []
+    entities = []
+    links = []
+    for entity, text in texts:
+        record, page_links = process_linkdata.parse_page(entity, text)
+        if record:
+            entities.append(record)
+            links.extend(page_links)
+        if len(links) >= config['batch_size']:
+            batches.append((entities, links))
+            entities = []
+            links = []
+    batches.append((entities, links))
+    # Total size of the documents written, to compare document shapes
+    size = [0]
+    if config['mongo']:
+        process_linkdata.db_name = benchmark_db_name
+        process_linkdata.compact = config['compact']
+        wikidata = process_linkdata.Wikidata()
+        wikidata.mcon.drop_database(benchmark_db_name)
+        wikidata.create_unique_indexes()
+        def run():
+            for entities, links in batches:
+                wikidata.insert_links(entities, links)
+            return sum(len(links) for entities, links in batches)
+    else:
+        # In-memory stand-in: the client side cost of a write
+        def run():
+            for entities, links in batches:
+                for doc in entities + links:
+                    if config['compact']:
+                        doc = compact_doc(doc)
+                    size[0] += len(bson.BSON.encode(doc))
+            return sum(len(links) for entities, links in batches)
+    result = timed(len(texts), run)
+    if not config['mongo']:
+        result['bson_bytes'] = size[0]
+    if config['mongo']:
+        wikidata.mcon.drop_database(benchmark_db_name)
+    return result
+
+def stage_classify(config):
+    '''Looks up articles in a link index and checks their wikitext.'''
+    wikidata_path = synthetic_wikidata(config['pages'], config['max_links'])
+    # Use the spanish titles of the wikidata dump so that lookups can hit
+    titles = []
+    for entity, text in read_texts(wikidata_path):
+        sitelinks, disambiguation = process_linkdata.decode_page(text)
+        if 'eswiki' in sitelinks:
+            titles.append(sitelinks['eswiki'])
+    index_path = synthetic_index(wikidata_path)
+    path = synthetic_wikipedia(config['wikipedia_pages'], config['mean_length']
+        , titles[:config['wikipedia_pages'] / 2])
+    texts = [(title, text or u'') for title, text in read_texts(path)]
+    wikipedia = process_wikidata.Wikipedia(path, index_path=index_path
+        , output_path=os.devnull, language='es')
+    def run():
+        # is_singleton reports the pages it skips, keep that out of the way
+        stdout = sys.stdout
+        sys.stdout = codecs.getwriter('utf8')(open(os.devnull, 'w'))
+        try:
+            size = process_wikidata.lookup_batch_size
+            for i in range(0, len(texts), size):
+                batch = texts[i:i + size]
+                links = wikipedia.find_links_index([title for title, text in batch])
+                for title, text in batch:
+                    link = links.get(title)
+                    wikipedia.is_singleton(title, link, text
+                        , link['sitelinks'] if link else 0)
+        finally:
+            sys.stdout = stdout
+    return timed(len(texts), run)
+
+def stage_process(name, config, result_q):
+    '''Runs one stage in its own process so that its peak RSS is its own.'''
+    try:
+        result = globals()['stage_%s' % name](config)
+        result['peak_rss_kb'] = peak_rss()
+    except:
+        # Let the parent know rather than leaving it waiting
+        result_q.put(None)
+        raise
+    result_q.put(result)
+
+def bench_stages(config, names, output_path=None, compare_path=None):
+    '''Runs each stage in isolation and saves the results as json.'''
+    results = {}
+    for name in names:
+        result_q = multiprocessing.Queue()
+        p = multiprocessing.Process(target=stage_process, args=(name, config, result_q))
+        p.start()
+        results[name] = result_q.get()
+        p.join()
+        if results[name] is None:
+            print "Stage %s failed" % name
+            sys.exit(1)
+    report = {'time':time.time(), 'host':socket.gethostname()
+        , 'config':config, 'stages':results}
+    print
+    print "stage        seconds     pages/s     links/s  peak RSS (MB)"
+    for name in names:
+        r = results[name]
+        print "%-8s %11.2f %11d %11d %14.1f" % (name, r['seconds'], r['pages_per_sec']
+            , r['links_per_sec'], r['peak_rss_kb'] / 1024.0)
+    if output_path is None:
+        output_path = os.path.join(data_dir, 'benchmark-%s.json'
+            % time.strftime('%Y%m%d-%H%M%S'))
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print "Results saved to %s" % output_path
+    if compare_path:
+        compare(compare_path, report)
+
+def compare(path, report):
+    '''Prints the change in throughput since a previous run.'''
+    with open(path) as f:
+        previous = json.load(f)
+    if previous['config'] != report['config']:
+        print "Warning: %s was run with a different configuration" % path
+    print
+    print "stage    pages/s before  pages/s after   change"
+    for name, r in sorted(report['stages'].items()):
+        if name not in previous['stages']:
+            continue
+        before = previous['stages'][name]['pages_per_sec']
+        print "%-8s %15d %14d %+8.1f%%" % (name, before, r['pages_per_sec']
+            , 100.0 * (r['pages_per_sec'] - before) / max(before, 0.000001))
+
+def bench_linkdata(page_count, process_counts):
+    '''Times a dry run of the wikidata ingest with different process counts.'''
+    path = synthetic_wikidata(page_count)
+    results = []
+    for n in process_counts:
+        process_linkdata.page_processes = n
+        wikidata = process_linkdata.Wikidata(path, dry_run=True)
+        start = time.time()
+        wikidata.process_linkdata()
+        elapsed = time.time() - start
+        results.append((n, elapsed))
+    print
+    print "page processes   seconds   pages/s   speedup"
+    for n, elapsed in results:
+        print "%14d %9.2f %9d %9.2f" % (n, elapsed, page_count / elapsed
+            , results[0][1] / elapsed)
+
+def bench_json(page_count, modes):
+    '''Times parse_page with each json decoding mode.'''
+    texts = read_texts(synthetic_wikidata(page_count))
+    results = []
+    expected = None
+    for mode in modes:
+        process_linkdata.json_mode = mode
+        start = time.time()
+        parsed = [process_linkdata.parse_page(entity, text) for entity, text in texts]
+        elapsed = time.time() - start
+        # Every mode must produce the same links
+        if expected is None:
+            expected = parsed
+        elif parsed != expected:
+            print "Mode %s gave different results" % mode
+        results.append((mode, elapsed))
+    print
+    print "json mode        seconds   pages/s   speedup"
+    for mode, elapsed in results:
+        print "%-12s %11.2f %9d %9.2f" % (mode, elapsed, page_count / elapsed
+            , results[0][1] / elapsed)
+
+def bench_dumps(page_count, languages):
+    '''Times several compressed dumps processed at once and checks the results.
+
+    Each dump runs in a pool worker that opens a multistream bz2 dump, with
+    parallel decompression requested, so this also checks that dumps open
+    from daemonic workers.  The singletons must match those found in the
+    uncompressed dumps one at a time.
+    '''
+    wikidata_path = synthetic_wikidata(page_count)
+    index_path = synthetic_index(wikidata_path)
+    out_dir = os.path.join(data_dir, 'benchmark-dumps')
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    paths = []
+    for language in languages:
+        path = os.path.join(out_dir, '%swiki-synthetic.xml' % language)
+        if not os.path.exists(path):
+            print "Generating %s" % path
+            synthetic_dumps.write_wikipedia_dump(path, page_count, language=language)
+            compress_dump(path, path + '.bz2')
+        paths.append(path)
+    dumpfile.decompress_processes = 2
+    # Both runs report every singleton, keep that out of the way
+    stdout = sys.stdout
+    sys.stdout = codecs.getwriter('utf8')(open(os.devnull, 'w'))
+    try:
+        start = time.time()
+        for language, path in zip(languages, paths):
+            process_wikidata.process_dump((path, language, index_path, path + '.expected'
+                , None, None))
+        serial = time.time() - start
+        start = time.time()
+        process_wikidata.process_dumps([path + '.bz2' for path in paths]
+            , index_path=index_path, output_dir=out_dir)
+        parallel = time.time() - start
+    finally:
+        sys.stdout = stdout
+    failed = False
+    for language, path in zip(languages, paths):
+        with open(path + '.expected') as f:
+            expected = sorted(f)
+        with open(os.path.join(out_dir, '%s-singletons.json' % language)) as f:
+            found = sorted(f)
+        if found != expected:
+            print "Dump %s gave different singletons" % path
+            failed = True
+    print
+    print "dumps one at a time: %.2fs, at once from bz2: %.2fs" % (serial, parallel)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure ingest throughput on synthetic dumps.')
+    parser.add_argument('benchmark', nargs='?', default='stages'
+        , choices=['stages', 'linkdata', 'json', 'dumps'], help='which benchmark to run')
+    parser.add_argument('--pages', type=int, default=200000
+        , help='number of pages in the synthetic wikidata dump')
+    parser.add_argument('--max-links', type=int, default=20
+        , help='maximum number of language links per wikidata page')
+    parser.add_argument('--wikipedia-pages', type=int, default=50000
+        , help='number of pages in the synthetic wikipedia dump')
+    parser.add_argument('--mean-length', type=int, default=3000
+        , help='mean length of synthetic wikipedia articles')
+    parser.add_argument('--stages', default=','.join(stages)
+        , help='comma separated stages to run: %s' % ', '.join(stages))
+    parser.add_argument('--json', choices=process_linkdata.json_modes
+        , default=process_linkdata.json_mode
+        , help='json decoding mode used by the stages')
+    parser.add_argument('--mongo', action='store_true'
+        , help='write to a local mongod in the db stage instead of only encoding BSON')
+    parser.add_argument('--compact', action='store_true'
+        , help='write compact documents in the db stage')
+    parser.add_argument('--output', metavar='PATH'
+        , help='where to save the results (default: data/benchmark-<time>.json)')
+    parser.add_argument('--compare', metavar='PATH'
+        , help='results of a previous run to compare against')
+    parser.add_argument('--processes', default='0,1,2,4'
+        , help='comma separated page process counts to compare (linkdata)')
+    parser.add_argument('--json-modes', default=','.join(process_linkdata.json_modes)
+        , help='comma separated json modes to compare (json)')
+    parser.add_argument('--languages', default='es,fr,de'
+        , help='comma separated languages of the synthetic wikipedia dumps (dumps)')
+    args = parser.parse_args()
+    if args.benchmark == 'stages':
+        process_linkdata.json_mode = args.json
+        config = {'pages':args.pages, 'max_links':args.max_links
+            , 'wikipedia_pages':args.wikipedia_pages, 'mean_length':args.mean_length
+            , 'batch_size':10000, 'mongo':args.mongo, 'compact':args.compact
+            , 'json_mode':args.json}
+        bench_stages(config, args.stages.split(','), args.output, args.compare)
+    elif args.benchmark == 'linkdata':
+        bench_linkdata(args.pages, [int(x) for x in args.processes.split(',')])
+    elif args.benchmark == 'json':
+        bench_json(args.pages, args.json_modes.split(','))
+    elif args.benchmark == 'dumps':
+        bench_dumps(args.wikipedia_pages, args.languages.split(','))
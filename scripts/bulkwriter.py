@@ -0,0 +1,210 @@
+# Cultural Singletons
+# Unordered bulk upserts and deletes with adaptive batch sizes
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import time
+from Queue import Queue
+from threading import Thread, Lock
+
+# Third party imports
+import pymongo
+
+# Local imports
+from languages import codes
+
+# Bulk write config
+# Documents per bulk write at the start.  The size grows while writes are
+# fast and shrinks when they are slow or the server drops the connection.
+initial_batch_size = 10000
+min_batch_size = 500
+max_batch_size = 100000
+# Bulk writes slower than this (in seconds) halve the batch size
+target_latency = 2.0
+# Number of bulk writes in flight at once.  Threads are fine here: they spend
+# their time waiting on the server, with the GIL released.
+writer_threads = 4
+# A failed write is retried in halves, at most this many times
+max_retries = 10
+
+# Compact documents
+# Field names are shortened and languages are stored as their position in
+# languages.codes (codes without one are kept as strings).
+compact_fields = {'entity':'e', 'language':'l', 'title':'t'
+    , 'disambiguation':'d', 'sitelinks':'s', 'languages':'ls'}
+expanded_fields = dict((v, k) for k, v in compact_fields.items())
+language_ids = dict((code, i) for i, code in enumerate(codes))
+
+def field(name, compact):
+    '''Returns the stored name of a field.'''
+    if compact:
+        return compact_fields[name]
+    return name
+
+def language_id(language):
+    '''Returns the compact id of a language code.'''
+    return language_ids.get(language, language)
+
+def language_code(language):
+    '''Returns the language code of a compact id.'''
+    if isinstance(language, int):
+        return codes[language]
+    return language
+
+def compact_doc(doc):
+    '''Returns a document with short field names and language ids.'''
+    out = {}
+    for key, value in doc.items():
+        if key == 'language':
+            value = language_id(value)
+        elif key == 'languages':
+            value = [language_id(x) for x in value]
+        out[compact_fields.get(key, key)] = value
+    return out
+
+def expand_doc(doc):
+    '''Returns a compact document with its full field names and language codes.'''
+    out = {}
+    for key, value in doc.items():
+        key = expanded_fields.get(key, key)
+        if key == 'language':
+            value = language_code(value)
+        elif key == 'languages':
+            value = [language_code(x) for x in value]
+        out[key] = value
+    return out
+
+def stored_compact(db):
+    '''Returns True if the language links in db are stored as compact documents.'''
+    meta = db.meta.find_one({'_id':'langlinks'})
+    return bool(meta and meta.get('compact'))
+
+class BulkWriter:
+    """Upserts or deletes documents with unordered bulk writes from a pool of
+    threads.
+
+    upsert() and delete() split documents into batches of the current batch
+    size and queue them.  Up to writer_threads batches are written at once, each over
+    its own pooled connection.  wait() returns once everything queued has
+    been written, so callers can checkpoint after it.
+    """
+
+    def __init__(self, db, compact=False, metrics=None, threads=None):
+        self.db = db
+        self.compact = compact
+        self.metrics = metrics
+        self.batch_size = initial_batch_size
+        self.lock = Lock()
+        self.error = None
+        if threads is None:
+            threads = writer_threads
+        # A bounded queue keeps the number of batches waiting in check
+        self.q = Queue(threads)
+        self.threads = []
+        for i in range(threads):
+            t = Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def upsert(self, collection, docs, keys):
+        '''Queues docs to be replaced or inserted, matching on keys.'''
+        self.queue('upsert', collection, docs, keys)
+
+    def delete(self, collection, docs, keys):
+        '''Queues the documents matching docs on keys to be deleted.'''
+        self.queue('delete', collection, docs, keys)
+
+    def queue(self, op, collection, docs, keys):
+        '''Splits docs into batches and queues them.'''
+        if self.compact:
+            docs = [compact_doc(doc) for doc in docs]
+            keys = [field(key, True) for key in keys]
+        i = 0
+        while i < len(docs):
+            size = self.batch_size
+            self.q.put((op, collection, docs[i:i + size], keys))
+            i += size
+
+    def wait(self):
+        '''Waits for all queued writes, raising the first error if any failed.'''
+        self.q.join()
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self):
+        '''Waits for all queued writes and stops the threads.'''
+        for t in self.threads:
+            self.q.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        self.wait()
+
+    def worker(self):
+        '''Writes batches from the queue until it gets None.'''
+        while True:
+            batch = self.q.get()
+            if batch is None:
+                self.q.task_done()
+                break
+            op, collection, docs, keys = batch
+            try:
+                # After an error the rest is skipped, wait() reports it
+                if self.error is None:
+                    self.write(op, collection, docs, keys)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.q.task_done()
+
+    def write(self, op, collection, docs, keys, retries=0):
+        '''Writes one batch, retrying in halves if the server drops it.'''
+        start = time.time()
+        try:
+            bulk = self.db[collection].initialize_unordered_bulk_op()
+            for doc in docs:
+                selector = bulk.find(dict((key, doc[key]) for key in keys))
+                if op == 'delete':
+                    selector.remove()
+                else:
+                    selector.upsert().replace_one(doc)
+            bulk.execute()
+        except pymongo.errors.AutoReconnect as e:
+            if retries >= max_retries:
+                raise
+            self.shrink()
+            print "Bulk write of %d docs failed (%s), retrying with batch size %d" % (
+                len(docs), e, self.batch_size)
+            if self.metrics:
+                with self.lock:
+                    self.metrics.count('retries')
+            time.sleep(min(0.1 * 2 ** retries, 10))
+            # Upserts are keyed on unique indexes so documents written before
+            # the failure are replaced rather than duplicated
+            half = max(1, len(docs) / 2)
+            self.write(op, collection, docs[:half], keys, retries + 1)
+            if half < len(docs):
+                self.write(op, collection, docs[half:], keys, retries + 1)
+            return
+        self.adapt(time.time() - start, len(docs))
+
+    def shrink(self):
+        '''Halves the batch size.'''
+        with self.lock:
+            self.batch_size = max(min_batch_size, self.batch_size / 2)
+
+    def adapt(self, seconds, size):
+        '''Adjusts the batch size to the latency of a write.'''
+        with self.lock:
+            if seconds > target_latency:
+                self.batch_size = max(min_batch_size, self.batch_size / 2)
+            elif seconds < target_latency / 2 and size >= self.batch_size:
+                # Only full batches say anything about larger ones
+                self.batch_size = min(max_batch_size, self.batch_size * 5 / 4)
+            if self.metrics:
+                self.metrics.add_time('bulk_write', seconds)
+                self.metrics.gauge('batch_size', self.batch_size)
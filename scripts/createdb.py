@@ -11,4 +11,6 @@ con = Connection('localhost')
 con.singletons.command('dropDatabase')
 db = con.singletons
 langlinks = db.langlinks
+entities = db.entities
 pages = db.pages
+meta = db.meta
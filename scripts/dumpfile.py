@@ -0,0 +1,333 @@
+# Cultural Singletons
+# Read pages from compressed or uncompressed XML dumps as a stream
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import bz2
+import gzip
+import multiprocessing
+from collections import namedtuple
+from xml.etree.cElementTree import XMLParser
+
+# Decompression config
+# Number of processes decompressing bz2 streams.  None uses one per core.
+decompress_processes = None
+# Amount of compressed data sent to a decompression process at a time
+piece_size = 4 * 1024 * 1024
+# Amount of compressed data read from disk at a time
+read_size = 1024 * 1024
+
+# Parse config
+# Amount of xml fed to the parser at a time
+feed_size = 16 * 1024
+
+# Resume config
+# read_pages() yields a page at most feed_size bytes after its end, so the
+# next page starts less than this far before tell().
+parse_margin = 64 * 1024
+
+# A page of a dump.  ns and title are strings, redirect is the target title
+# or None, text is the text of the last revision or None if it is empty.
+Page = namedtuple('Page', ['ns', 'title', 'redirect', 'text'])
+
+# Every bz2 stream starts with a byte aligned header followed by the magic
+# number of its first block.  Multistream dumps (e.g.
+# 'pages-articles-multistream.xml.bz2') are a concatenation of many small
+# streams, which can be decompressed independently.  Inside a stream, blocks
+# are not byte aligned so a false match is vanishingly unlikely.
+block_magic = '1AY&SY'
+
+def last_stream_start(data):
+    '''Returns the offset of the last stream header after the first byte.'''
+    end = len(data)
+    while True:
+        i = data.rfind(block_magic, 5, end)
+        if i < 0:
+            return None
+        if data[i - 4:i - 1] == 'BZh' and data[i - 1] in '123456789':
+            return i - 4
+        end = i
+
+def open_dump(path, offset=0):
+    '''Opens an xml dump for reading, decompressing .bz2 and .gz files.
+
+    With a non-zero offset (in decompressed bytes) reading starts at the first
+    page at or after the offset.
+    '''
+    if path.endswith('.bz2'):
+        f = BZ2DumpFile(path, decompress_processes)
+    elif path.endswith('.gz'):
+        f = gzip.open(path, 'rb')
+    else:
+        f = open(path, 'rb')
+    if offset > 0:
+        f = ResumedDumpFile(f, offset)
+    return f
+
+def resume_offset(f):
+    '''Returns an offset to resume from after the page just parsed from f.
+
+    Every page starting before the offset has been completely parsed.
+    '''
+    return max(0, f.tell() - parse_margin)
+
+def decompress_streams(data):
+    '''Decompresses one or more complete bz2 streams.'''
+    out = []
+    while len(data) > 0:
+        decompressor = bz2.BZ2Decompressor()
+        out.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return ''.join(out)
+
+class BZ2DumpFile:
+    """File-like reader for bz2 dumps.
+
+    Streams of a multistream dump are grouped into pieces and decompressed by
+    a pool of processes, keeping a few pieces in flight.  If no stream
+    boundary is found (a single stream dump), the rest of the file is
+    decompressed serially.
+    """
+
+    def __init__(self, path, processes=None):
+        self.f = open(path, 'rb')
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        # Pool workers (e.g. one per dump in process_wikidata.py) are daemonic
+        # and can't start processes of their own
+        if multiprocessing.current_process().daemon:
+            processes = 1
+        self.processes = processes
+        self.pool = None
+        if self.processes > 1:
+            self.pool = multiprocessing.Pool(self.processes)
+        self.chunks = self.decompressed_chunks()
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0
+
+    def pieces(self):
+        '''Yields (complete, data) pieces of compressed data.
+
+        Complete pieces hold whole streams.  Once a single stream grows beyond
+        the piece size, the remainder of the file is yielded as incomplete
+        pieces to be decompressed serially.
+        '''
+        pending = ''
+        while True:
+            data = self.f.read(read_size)
+            if not data:
+                if len(pending) > 0:
+                    yield True, pending
+                return
+            pending += data
+            if len(pending) < piece_size:
+                continue
+            last = last_stream_start(pending)
+            if last is not None:
+                yield True, pending[:last]
+                pending = pending[last:]
+            elif len(pending) >= 2 * piece_size:
+                yield False, pending
+                break
+        # Single stream: pass the rest of the file through
+        while True:
+            data = self.f.read(read_size)
+            if not data:
+                break
+            yield False, data
+
+    def decompressed_chunks(self):
+        '''Yields decompressed data in file order.'''
+        in_flight = []
+        decompressor = None
+        for complete, data in self.pieces():
+            if complete and self.pool is not None:
+                in_flight.append(self.pool.apply_async(decompress_streams, (data,)))
+                if len(in_flight) > 2 * self.processes:
+                    yield in_flight.pop(0).get()
+                continue
+            if complete:
+                yield decompress_streams(data)
+                continue
+            # Serial decompression of a stream that may continue in the next
+            # piece
+            while len(in_flight) > 0:
+                yield in_flight.pop(0).get()
+            while len(data) > 0:
+                if decompressor is None:
+                    decompressor = bz2.BZ2Decompressor()
+                try:
+                    out = decompressor.decompress(data)
+                except EOFError:
+                    # The previous stream ended exactly at the end of a read
+                    decompressor = bz2.BZ2Decompressor()
+                    out = decompressor.decompress(data)
+                yield out
+                # Data after the end of a stream belongs to the next stream
+                data = decompressor.unused_data
+                if len(data) > 0:
+                    decompressor = None
+        for result in in_flight:
+            yield result.get()
+
+    def read(self, size=-1):
+        '''Reads up to size bytes of decompressed data.'''
+        while size < 0 or len(self.buf) - self.pos < size:
+            try:
+                chunk = self.chunks.next()
+            except StopIteration:
+                break
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+        if size < 0:
+            size = len(self.buf) - self.pos
+        data = self.buf[self.pos:self.pos + size]
+        self.pos += len(data)
+        self.offset += len(data)
+        return data
+
+    def tell(self):
+        '''Returns the position in the decompressed data.'''
+        return self.offset
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self.f.close()
+
+class ResumedDumpFile:
+    """File-like reader for a dump starting part way through.
+
+    The root element of the dump is read from the start of the file and
+    returned before the first page at or after the offset, so that the result
+    is well formed xml.  tell() reports positions in the original file.
+    """
+
+    def __init__(self, f, offset):
+        self.f = f
+        head = self.f.read(parse_margin)
+        root = head.index('<mediawiki')
+        root_end = head.index('>', root) + 1
+        self.pending = head[root:root_end]
+        if offset < len(head):
+            data = head[offset:]
+        else:
+            self.skip(offset - len(head))
+            data = ''
+        # Find the start of the next page
+        while True:
+            more = self.f.read(parse_margin)
+            data += more
+            page = data.find('<page>')
+            if page >= 0 or not more:
+                break
+            data = data[-5:]
+        if page < 0:
+            raise IOError('No page found after offset %d' % offset)
+        self.pending += data[page:]
+        self.pending_offset = self.f.tell() - len(data) + page
+
+    def skip(self, count):
+        '''Skips count bytes forward.'''
+        if isinstance(self.f, file):
+            self.f.seek(count, 1)
+            return
+        while count > 0:
+            data = self.f.read(min(count, read_size))
+            if not data:
+                break
+            count -= len(data)
+
+    def read(self, size=-1):
+        '''Reads up to size bytes.'''
+        if len(self.pending) > 0:
+            if size < 0:
+                size = len(self.pending)
+            data = self.pending[:size]
+            self.pending = self.pending[size:]
+            return data
+        return self.f.read(size)
+
+    def tell(self):
+        '''Returns the position in the original (decompressed) dump.'''
+        if len(self.pending) > 0:
+            return self.pending_offset
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+class PageReader:
+    """XMLParser target that collects the pages of a dump.
+
+    No tree is built: the text of the few elements we need is joined when
+    they end and everything else is dropped, so memory doesn't grow with the
+    number of pages or revisions.  The export schema is taken from the root
+    element rather than assumed.
+    """
+
+    def __init__(self):
+        self.schema = None
+        self.version = None
+        self.set_schema('')
+        self.pages = []
+        self.page = {}
+        # Character data, appended to directly by the parser
+        self.buf = []
+        self.data = self.buf.append
+        self.mark = 0
+
+    def set_schema(self, uri):
+        '''Sets the namespace of the tags to look for.'''
+        prefix = '{%s}' % uri if uri else ''
+        self.fields = {prefix + 'ns':'ns', prefix + 'title':'title', prefix + 'text':'text'}
+        self.page_tag = prefix + 'page'
+        self.redirect_tag = prefix + 'redirect'
+
+    def start(self, tag, attrib):
+        if tag in self.fields:
+            self.mark = len(self.buf)
+        elif tag == self.redirect_tag:
+            self.page['redirect'] = attrib.get('title', u'')
+        elif self.schema is None:
+            # The root element, e.g. '{http://www.mediawiki.org/xml/export-0.10/}mediawiki'
+            self.schema = tag[1:tag.index('}')] if tag.startswith('{') else ''
+            self.version = attrib.get('version')
+            self.set_schema(self.schema)
+
+    def end(self, tag):
+        name = self.fields.get(tag)
+        if name is not None:
+            # A later revision replaces the text of an earlier one
+            self.page[name] = ''.join(self.buf[self.mark:]) or None
+            del self.buf[:]
+        elif tag == self.page_tag:
+            page = self.page
+            self.pages.append(Page(page.get('ns'), page.get('title')
+                , page.get('redirect'), page.get('text')))
+            self.page = {}
+            del self.buf[:]
+
+    def close(self):
+        pass
+
+def read_pages(f):
+    '''Yields a Page for each page of an open dump.'''
+    reader = PageReader()
+    parser = XMLParser(target=reader)
+    while True:
+        data = f.read(feed_size)
+        if not data:
+            break
+        parser.feed(data)
+        if len(reader.pages) > 0:
+            pages = reader.pages
+            reader.pages = []
+            for page in pages:
+                yield page
+    parser.close()
+    for page in reader.pages:
+        yield page
@@ -0,0 +1,124 @@
+# Cultural Singletons
+# Export singleton pages as compressed json lines or Parquet snapshots
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import os
+import gzip
+import json
+import time
+import argparse
+import datetime
+
+# Third party imports
+import pymongo
+from bson.objectid import ObjectId
+
+# Parquet output needs pyarrow, json lines work without it
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Export config
+db_host = 'localhost'
+db_name = 'singletons'
+output_dir = '../data'
+# Pages read from mongod at a time while writing a snapshot.  Larger than the
+# server's, as nothing waits for the first rows here.
+cursor_batch_size = 10000
+# Rows per Parquet row group
+row_group_size = 100000
+export_formats = ['jsonl', 'parquet']
+extensions = {'jsonl':'.jsonl.gz', 'parquet':'.parquet'}
+
+def snapshot_path(directory, language, export_format, date=None):
+    '''Returns the path of a snapshot, e.g. singletons-es-20240101.jsonl.gz.'''
+    if date is None:
+        date = datetime.datetime.utcnow().strftime('%Y%m%d')
+    name = 'singletons-%s-%s%s' % (language or 'all', date, extensions[export_format])
+    return os.path.join(directory, name)
+
+def find_pages(db, language=None, since=None):
+    '''Returns a cursor over singleton pages in _id order.'''
+    query = {}
+    if language:
+        query['language'] = language
+    if since:
+        query['_id'] = {'$gt':since}
+    cursor = db.pages.find(query, fields=['language', 'title'])
+    return cursor.sort('_id', pymongo.ASCENDING).batch_size(cursor_batch_size)
+
+def write_jsonl(pages, path):
+    '''Writes pages to a gzipped json lines file and returns the page count.'''
+    count = 0
+    # Lines match those of the server's /api/singletons
+    f = gzip.open(path, 'wb')
+    for page in pages:
+        f.write(json.dumps({'id':str(page['_id']), 'language':page['language']
+            , 'title':page['title']}) + '\n')
+        count += 1
+    f.close()
+    return count
+
+def write_parquet(pages, path):
+    '''Writes pages to a Parquet file and returns the page count.'''
+    schema = pyarrow.schema([('id', pyarrow.string()), ('language', pyarrow.string())
+        , ('title', pyarrow.string())])
+    writer = pyarrow.parquet.ParquetWriter(path, schema, compression='snappy')
+    count = 0
+    columns = ([], [], [])
+    def flush():
+        table = pyarrow.Table.from_arrays([pyarrow.array(c, type=pyarrow.string())
+            for c in columns], schema=schema)
+        writer.write_table(table)
+        for c in columns:
+            del c[:]
+    for page in pages:
+        columns[0].append(str(page['_id']))
+        columns[1].append(page['language'])
+        columns[2].append(page['title'])
+        count += 1
+        if len(columns[0]) >= row_group_size:
+            flush()
+    if columns[0] or count == 0:
+        flush()
+    writer.close()
+    return count
+
+def export(path, export_format, language=None, since=None):
+    '''Writes a snapshot of the singleton pages to path.'''
+    start = time.time()
+    mcon = pymongo.Connection(db_host)
+    pages = find_pages(mcon[db_name], language, since)
+    # Write next to the snapshot and rename, so readers never see half of it
+    tmp_path = path + '.tmp'
+    if export_format == 'parquet':
+        count = write_parquet(pages, tmp_path)
+    else:
+        count = write_jsonl(pages, tmp_path)
+    os.rename(tmp_path, path)
+    print "Exported %d singletons to %s in %.1fs" % (count, path, time.time() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export singleton pages from the database.')
+    parser.add_argument('--format', choices=export_formats, default='jsonl'
+        , help='gzipped json lines, or Parquet (needs pyarrow)')
+    parser.add_argument('--language'
+        , help='only export singletons of one language, e.g. es')
+    parser.add_argument('--since', metavar='ID'
+        , help='only export singletons added after the one with this id')
+    parser.add_argument('--output', metavar='PATH'
+        , help='snapshot path, by default singletons-<language>-<date> in %s' % output_dir)
+    args = parser.parse_args()
+    if args.format == 'parquet' and pyarrow is None:
+        parser.error('--format parquet needs pyarrow')
+    since = None
+    if args.since:
+        if not ObjectId.is_valid(args.since):
+            parser.error('--since is not a valid id: %s' % args.since)
+        since = ObjectId(args.since)
+    path = args.output or snapshot_path(output_dir, args.language, args.format)
+    export(path, args.format, args.language, since)
@@ -0,0 +1,121 @@
+# Cultural Singletons
+# On-disk index of language links for finding singletons without a database
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import os
+import mmap
+import heapq
+import struct
+import hashlib
+import tempfile
+
+# Each record is an 8 byte hash of 'language:title' followed by the number of
+# sitelinks of the entity.  The high bit of the count is the disambiguation
+# flag.  Records are sorted by hash so they can be binary searched in place.
+key_size = 8
+value = struct.Struct('>H')
+record_size = key_size + value.size
+disambiguation_bit = 0x8000
+
+# Number of records sorted in memory before being written to a temporary run
+run_size = 2000000
+
+def title_key(language, title):
+    '''Returns the hash used to look up an article.'''
+    return hashlib.md5((u'%s:%s' % (language, title)).encode('utf8')).digest()[:key_size]
+
+class LinkIndexWriter:
+    """Builds an index file from language links.
+
+    Links can be added in any order.  They are sorted in runs which are merged
+    into the index file by close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, language, title, sitelinks, disambiguation):
+        '''Adds a link to the index.'''
+        flags = disambiguation_bit if disambiguation else 0
+        self.records.append(title_key(language, title)
+            + value.pack(min(sitelinks, disambiguation_bit - 1) | flags))
+        if len(self.records) >= run_size:
+            self.write_run()
+
+    def write_run(self):
+        '''Sorts buffered records and writes them to a temporary file.'''
+        self.records.sort()
+        f = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+        f.write(''.join(self.records))
+        f.seek(0)
+        self.runs.append(f)
+        self.count += len(self.records)
+        self.records = []
+
+    def read_run(self, f):
+        '''Yields the records in a temporary run file.'''
+        while True:
+            data = f.read(record_size * 4096)
+            if not data:
+                break
+            for i in xrange(0, len(data), record_size):
+                yield data[i:i + record_size]
+
+    def close(self):
+        '''Merges all runs into the index file.'''
+        self.records.sort()
+        self.count += len(self.records)
+        runs = [self.read_run(f) for f in self.runs]
+        with open(self.path, 'wb') as out:
+            buf = []
+            for record in heapq.merge(self.records, *runs):
+                buf.append(record)
+                if len(buf) >= 4096:
+                    out.write(''.join(buf))
+                    buf = []
+            out.write(''.join(buf))
+        for f in self.runs:
+            f.close()
+        self.records = []
+        self.runs = []
+
+class LinkIndex:
+    """Read-only, memory-mapped index of language links."""
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.count = self.size / record_size
+        if self.size > 0:
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = ''
+
+    def lookup(self, language, title):
+        '''Returns (sitelinks, disambiguation) for an article, or None.'''
+        key = title_key(language, title)
+        # Binary search for the first record with a key >= key
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * record_size
+            if self.map[offset:offset + key_size] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        offset = lo * record_size
+        if lo == self.count or self.map[offset:offset + key_size] != key:
+            return None
+        (v,) = value.unpack(self.map[offset + key_size:offset + record_size])
+        return (v & ~disambiguation_bit, 1 if v & disambiguation_bit else 0)
+
+    def close(self):
+        if self.size > 0:
+            self.map.close()
+        self.f.close()
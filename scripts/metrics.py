@@ -0,0 +1,171 @@
+# Cultural Singletons
+# Stage timers, counters and gauges for the ingest scripts
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import os
+import json
+import time
+import pstats
+import socket
+import cProfile
+import resource
+
+# Metrics config
+# Seconds between reports written to the metrics file
+report_interval = 60
+# Prefix of Prometheus metric names
+prom_prefix = 'singletons'
+
+def suffixed_path(path, suffix):
+    '''Returns path with a suffix before the extension, e.g. m.json -> m-es.json.'''
+    base, ext = os.path.splitext(path)
+    return '%s-%s%s' % (base, suffix, ext)
+
+def rss():
+    '''Returns the current resident set size in bytes, or None if unknown.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return None
+
+def peak_rss():
+    '''Returns the peak resident set size in bytes.'''
+    # ru_maxrss is in kB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Metrics:
+    """Collects per-stage timings, counters and gauges for one ingest run.
+
+    Stage times are added by the caller (add_time) so that hot loops only pay
+    for two calls to time.time().  Every report_interval seconds, report()
+    appends a json line to the metrics file, or rewrites it in the Prometheus
+    text format if its name ends in .prom (for node_exporter's textfile
+    collector).  Without a path nothing is written until summary().
+    """
+
+    def __init__(self, name, path=None, labels=None, interval=None):
+        self.name = name
+        self.path = path
+        self.labels = labels or {}
+        self.interval = report_interval if interval is None else interval
+        self.start_time = time.time()
+        self.report_time = self.start_time
+        # stage -> [calls, total seconds, max seconds, last seconds]
+        self.timers = {}
+        self.counters = {}
+        # name -> value or function returning the value
+        self.gauges = {}
+
+    def add_time(self, stage, seconds, calls=1):
+        '''Adds time spent in a stage.'''
+        timer = self.timers.get(stage)
+        if timer is None:
+            timer = self.timers[stage] = [0, 0.0, 0.0, 0.0]
+        timer[0] += calls
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+        timer[3] = seconds
+
+    def count(self, name, n=1):
+        '''Adds n to a counter.'''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        '''Sets a gauge.  value may be a function, called at report time.'''
+        self.gauges[name] = value
+
+    def snapshot(self):
+        '''Returns the current values of all metrics as a dict.'''
+        now = time.time()
+        gauges = {}
+        for name, value in self.gauges.items():
+            if callable(value):
+                try:
+                    value = value()
+                except NotImplementedError:
+                    # Queue.qsize() is not available on every platform
+                    value = None
+            gauges[name] = value
+        gauges['rss_bytes'] = rss()
+        gauges['peak_rss_bytes'] = peak_rss()
+        timers = {}
+        for stage, (calls, total, longest, last) in self.timers.items():
+            timers[stage] = {'calls':calls, 'seconds':total, 'max_seconds':longest
+                , 'last_seconds':last}
+        return {'name':self.name, 'labels':self.labels, 'host':socket.gethostname()
+            , 'pid':os.getpid(), 'time':now, 'elapsed':now - self.start_time
+            , 'timers':timers, 'counters':dict(self.counters), 'gauges':gauges}
+
+    def maybe_report(self):
+        '''Reports if report_interval seconds have passed since the last report.'''
+        if self.path and time.time() - self.report_time >= self.interval:
+            self.report()
+
+    def report(self):
+        '''Writes the current metrics to the metrics file.'''
+        self.report_time = time.time()
+        if not self.path:
+            return
+        snapshot = self.snapshot()
+        if self.path.endswith('.prom'):
+            # Replace the file atomically so a scrape never sees half of it
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.prometheus(snapshot))
+            os.rename(tmp_path, self.path)
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(snapshot, sort_keys=True) + '\n')
+
+    def prometheus(self, snapshot):
+        '''Returns a snapshot in the Prometheus text format.'''
+        prefix = '%s_%s' % (prom_prefix, self.name)
+        labels = dict(self.labels)
+        def line(metric, value, **extra):
+            all_labels = dict(labels, **extra)
+            label_str = ','.join('%s="%s"' % (k, v) for k, v in sorted(all_labels.items()))
+            if label_str:
+                label_str = '{%s}' % label_str
+            return '%s_%s%s %s\n' % (prefix, metric, label_str, repr(float(value)))
+        lines = []
+        lines.append(line('elapsed_seconds', snapshot['elapsed']))
+        for stage, timer in sorted(snapshot['timers'].items()):
+            lines.append(line('stage_calls_total', timer['calls'], stage=stage))
+            lines.append(line('stage_seconds_total', timer['seconds'], stage=stage))
+            lines.append(line('stage_max_seconds', timer['max_seconds'], stage=stage))
+            lines.append(line('stage_last_seconds', timer['last_seconds'], stage=stage))
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(line('%s_total' % name, value))
+        for name, value in sorted(snapshot['gauges'].items()):
+            if value is not None:
+                lines.append(line(name, value))
+        return ''.join(lines)
+
+    def summary(self):
+        '''Writes a final report and prints where the time went.'''
+        self.report()
+        elapsed = max(time.time() - self.start_time, 0.000001)
+        print
+        print "stage          calls     seconds    % of run   max (s)"
+        for stage, (calls, total, longest, last) in sorted(self.timers.items()):
+            print "%-10s %9d %11.1f %9.1f%% %9.3f" % (stage, calls, total
+                , 100.0 * total / elapsed, longest)
+        print "Peak memory: %.1f MB" % (peak_rss() / 1048576.0)
+
+def start_profile():
+    '''Starts profiling this process with cProfile.'''
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+def stop_profile(profile, path, limit=20):
+    '''Saves profile stats to path and prints the most expensive functions.'''
+    profile.disable()
+    profile.dump_stats(path)
+    print
+    print "Profile saved to %s" % path
+    pstats.Stats(path).sort_stats('cumulative').print_stats(limit)
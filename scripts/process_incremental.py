@@ -0,0 +1,265 @@
+# Cultural Singletons
+# Apply daily incremental ('adds-changes') dumps to the database
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import os
+import json
+import time
+import argparse
+import datetime
+
+# Third party imports
+import pymongo
+
+# Local imports
+from dumpfile import open_dump, read_pages
+from bulkwriter import BulkWriter, field, expand_doc, stored_compact
+from process_linkdata import decode_page, page_links
+from process_wikidata import Wikipedia, dump_language
+
+# Incremental config
+# Incremental dumps are published daily at
+# https://dumps.wikimedia.org/other/incr/<wiki>/<date>/ as
+# '<wiki>-<date>-pages-meta-hist-incr.xml.bz2'.  They hold every revision
+# made that day to new or changed pages.  Deletions are not included.
+db_host = 'localhost'
+db_name = 'singletons'
+# Number of changed entities or articles applied at a time
+change_batch_size = 5000
+
+class Incremental:
+    """Applies incremental dumps to the language links and singleton pages.
+
+    Changed wikidata entities replace their language links.  Articles whose
+    links changed are removed from the singletons if they clearly no longer
+    are one.  Articles that may have become singletons need their text to be
+    checked, so they wait in the recheck collection until the article shows
+    up in a wikipedia dump of their language.
+    """
+
+    def __init__(self):
+        self.mcon = pymongo.Connection(db_host)
+        self.mdb = self.mcon[db_name]
+        # Links may be stored as compact documents, see bulkwriter.py
+        self.compact = stored_compact(self.mdb)
+        self.links = BulkWriter(self.mdb, self.compact)
+        self.pages = BulkWriter(self.mdb)
+        self.entity_count = 0
+        self.removed_count = 0
+        self.recheck_count = 0
+        self.singleton_count = 0
+
+    def create_indexes(self):
+        """Creates the indexes used to find changed articles."""
+        print "Creating index on: pages.(language, title)"
+        self.mdb.pages.ensure_index([('language', pymongo.ASCENDING), ('title', pymongo.ASCENDING)])
+        print "Creating unique index on: recheck.(language, title)"
+        self.mdb.recheck.ensure_index([('language', pymongo.ASCENDING), ('title', pymongo.ASCENDING)], unique=True)
+
+    def applied(self, path):
+        """Returns True if the dump has been applied before."""
+        meta = self.mdb.meta.find_one({'_id':'incremental'})
+        return bool(meta and os.path.basename(path) in meta.get('applied', []))
+
+    def mark_applied(self, path):
+        """Records that a dump has been applied."""
+        self.mdb.meta.update({'_id':'incremental'}
+            , {'$addToSet':{'applied':os.path.basename(path)}}, upsert=True)
+
+    def mark_updated(self):
+        """Tells the server that the singleton pages have changed."""
+        self.mdb.meta.save({'_id':'pages', 'updated':datetime.datetime.utcnow()})
+
+    def apply_wikidata(self, path):
+        """Replaces the language links of every entity changed in a dump."""
+        start = time.time()
+        entity_count = self.entity_count
+        batch = {}
+        dump = open_dump(path)
+        for page in read_pages(dump):
+            if page.ns != '0':
+                continue
+            # The last revision of an entity wins
+            batch[page.title] = page
+            if len(batch) >= change_batch_size:
+                self.apply_entities(batch)
+                batch = {}
+        dump.close()
+        self.apply_entities(batch)
+        print "Applied %s: %d entities in %.1fs" % (os.path.basename(path)
+            , self.entity_count - entity_count, time.time() - start)
+
+    def apply_entities(self, pages):
+        """Replaces the language links of changed entities.
+
+        Entities are only deleted if they were redirected (merged) or their
+        links emptied.  Raises ValueError for json without a links object,
+        rather than taking it for an entity without links.
+        """
+        if len(pages) == 0:
+            return
+        entities = []
+        links = []
+        deleted = []
+        changed = []
+        for entity, page in pages.items():
+            if page.text is None:
+                # A suppressed revision, the entity is left as it is
+                continue
+            changed.append(entity)
+            if page.redirect is not None:
+                deleted.append({'entity':entity})
+                continue
+            sitelinks, disambiguation = decode_page(page.text)
+            if sitelinks is None:
+                # Older dumps mark redirects in the json only
+                if json.loads(page.text).get('redirect'):
+                    deleted.append({'entity':entity})
+                    continue
+                raise ValueError('No "links" object in the json of %s, not applying'
+                    ' a dump in an unknown format' % entity)
+            record, entity_links = page_links(entity, sitelinks, disambiguation)
+            if record:
+                entities.append(record)
+                links.extend(entity_links)
+            else:
+                # Emptied links ({} or [] in the json)
+                deleted.append({'entity':entity})
+        # Links that are no longer there have to be deleted
+        current = set((link['entity'], link['language']) for link in links)
+        old = self.find_links(changed)
+        removed = [{'entity':link['entity'], 'language':link['language']}
+            for link in old if (link['entity'], link['language']) not in current]
+        self.links.upsert('entities', entities, ['entity'])
+        self.links.delete('entities', deleted, ['entity'])
+        self.links.upsert('langlinks', links, ['entity', 'language'])
+        self.links.delete('langlinks', removed, ['entity', 'language'])
+        self.links.wait()
+        self.entity_count += len(changed)
+        # Both the old and the new titles may have changed status
+        titles = set((link['language'], link['title']) for link in old)
+        titles.update((link['language'], link['title']) for link in links)
+        self.recheck_titles(titles, links)
+
+    def find_links(self, entities):
+        """Returns the stored language links of entities."""
+        cursor = self.mdb.langlinks.find(
+            {field('entity', self.compact):{'$in':entities}}
+            , fields=[field(x, self.compact) for x in ['entity', 'language', 'title']])
+        if self.compact:
+            return [expand_doc(link) for link in cursor]
+        return list(cursor)
+
+    def recheck_titles(self, titles, links):
+        """Updates the singleton status of articles whose links changed."""
+        linked = dict(((link['language'], link['title']), link) for link in links)
+        removed = []
+        recheck = []
+        for language, title in titles:
+            link = linked.get((language, title))
+            page = {'language':language, 'title':title}
+            if link and (link['sitelinks'] > 1 or link['disambiguation'] == 1):
+                removed.append(page)
+            else:
+                # Possibly a singleton now, the text has to be checked
+                recheck.append(page)
+        self.pages.delete('pages', removed, ['language', 'title'])
+        self.pages.upsert('recheck', recheck, ['language', 'title'])
+        self.pages.wait()
+        self.removed_count += len(removed)
+        self.recheck_count += len(recheck)
+
+    def apply_wikipedia(self, path, pending_only=False):
+        """Checks the articles in a wikipedia dump and any waiting rechecks.
+
+        With pending_only set (e.g. for a full dump) only articles waiting
+        for a recheck are looked at.
+        """
+        start = time.time()
+        singleton_count = self.singleton_count
+        wikipedia = Wikipedia(path)
+        language = wikipedia.language
+        pending = set(page['title'] for page in self.mdb.recheck.find(
+            {'language':language}, fields=['title']))
+        print "%d %s articles waiting for a recheck" % (len(pending), language)
+        batch = {}
+        page_count = 0
+        dump = open_dump(path)
+        for page in read_pages(dump):
+            if page.ns != '0':
+                continue
+            title = wikipedia.ensure_unicode(page.title)
+            if pending_only and title not in pending:
+                continue
+            page_count += 1
+            batch[title] = page
+            if len(batch) >= change_batch_size:
+                self.apply_articles(wikipedia, batch)
+                batch = {}
+        dump.close()
+        self.apply_articles(wikipedia, batch)
+        print "Applied %s: %d articles, %d singletons in %.1fs" % (os.path.basename(path)
+            , page_count, self.singleton_count - singleton_count, time.time() - start)
+
+    def apply_articles(self, wikipedia, pages):
+        """Updates the singleton status of changed articles."""
+        if len(pages) == 0:
+            return
+        links = wikipedia.find_links(pages.keys())
+        singletons = []
+        others = []
+        for title, page in pages.items():
+            doc = {'language':wikipedia.language, 'title':title}
+            link = links.get(title)
+            article_count = link['sitelinks'] if link else 0
+            text = wikipedia.ensure_unicode(page.text or '')
+            if page.redirect is None and wikipedia.is_singleton(title, link, text, article_count):
+                singletons.append(doc)
+            else:
+                others.append(doc)
+        # Upserts keep the _id, and so the position, of existing singletons
+        self.pages.upsert('pages', singletons, ['language', 'title'])
+        self.pages.delete('pages', others, ['language', 'title'])
+        self.pages.delete('recheck', singletons + others, ['language', 'title'])
+        self.pages.wait()
+        self.singleton_count += len(singletons)
+
+    def close(self):
+        self.links.close()
+        self.pages.close()
+
+def dump_date(path):
+    '''Returns the date in a dump name, e.g. '20240101', for ordering dumps.'''
+    parts = os.path.basename(path).split('-')
+    return parts[1] if len(parts) > 1 else ''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply incremental dumps to the database.')
+    parser.add_argument('dumps', nargs='+'
+        , help='wikidatawiki and wikipedia adds-changes dumps, e.g. eswiki-20240101-pages-meta-hist-incr.xml.bz2')
+    parser.add_argument('--pending-only', action='store_true'
+        , help='only check articles waiting for a recheck (for full wikipedia dumps)')
+    parser.add_argument('--force', action='store_true'
+        , help='apply dumps even if they have been applied before')
+    args = parser.parse_args()
+    incremental = Incremental()
+    incremental.create_indexes()
+    # Links first, so that articles they affect can be checked against the
+    # wikipedia dumps of the same day
+    wikidata = [path for path in args.dumps if dump_language(path) == 'wikidata']
+    wikipedia = [path for path in args.dumps if dump_language(path) != 'wikidata']
+    for path in sorted(wikidata, key=dump_date) + sorted(wikipedia, key=dump_date):
+        if not args.force and incremental.applied(path):
+            print "Skipping %s, already applied" % path
+            continue
+        if path in wikidata:
+            incremental.apply_wikidata(path)
+        else:
+            incremental.apply_wikipedia(path, args.pending_only)
+        incremental.mark_applied(path)
+    incremental.mark_updated()
+    incremental.close()
+    print "Removed %d singletons, %d articles left to recheck" % (incremental.removed_count
+        , incremental.mdb.recheck.count())
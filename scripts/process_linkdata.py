@@ -4,20 +4,43 @@
 # MIT Center for Civic Media
 
 # Standard imports
+import os
 import sys
 import json
 import re
 import time
-from Queue import Queue
+import argparse
+import traceback
+import multiprocessing
+from Queue import Queue, Full
+from collections import namedtuple
 from threading import Thread
-from xml.etree.cElementTree import ElementTree, iterparse
 
 # Third party imports
 import pymongo
 
+# Local imports
+from dumpfile import open_dump, read_pages, resume_offset, feed_size
+from linkindex import LinkIndexWriter
+import bulkwriter
+from bulkwriter import BulkWriter, field, stored_compact
+import metrics
+from metrics import Metrics, start_profile, stop_profile
+
 # XML Config
+# Compressed dumps (.xml.bz2, .xml.gz) are decompressed on the fly
 pages = '../data/wikidatawiki-latest-pages-articles.xml'
-prefix = '{http://www.mediawiki.org/xml/export-0.8/}'
+
+# Database config
+db_host = 'localhost'
+db_name = 'singletons'
+# Store language links with short field names and language ids, see
+# bulkwriter.py.  Readers find out from the meta collection.
+compact = False
+# Number of links buffered before they are handed to the database writer,
+# which splits them into bulk writes of its own (adaptive) size.  The dump
+# position is checkpointed after each buffer is written.
+link_batch_size = 250000
 
 # Threading config
 # Threading with python threads degrades performance, probably because of GIL.
@@ -25,14 +48,217 @@ prefix = '{http://www.mediawiki.org/xml/export-0.8/}'
 page_thread = False
 link_thread = False
 
+# Multiprocessing config
+# Number of worker processes decoding page json.  With 0 pages are decoded by
+# the main process (or the page thread above).
+page_processes = 0
+# Number of worker processes inserting batches of links into the database.
+link_processes = 2
+# Number of pages sent to a worker process at a time
+page_chunk_size = 500
+
+# Checkpoint config
+# The position in the dump is saved after links are written, at most once per
+# checkpoint_interval seconds.  Restart with --resume to continue from there.
+# The checkpoint is removed once the whole dump has been written.
+checkpoint_interval = 60
+
+# Where a page ends in the dump: the offset to resume from after it (see
+# dumpfile.resume_offset), the reader position, the number of pages read up to
+# it and its title
+DumpPosition = namedtuple('DumpPosition', ['offset', 'tell', 'page_count', 'title'])
+
+# JSON config
+# Pages are decoded with one of json_backends, or with 'scan', which decodes
+# only the sitelinks and looks at the claims only if the text mentions one of
+# the disambiguation items.
+json_mode = 'json'
+json_backends = {'json':json.loads}
+try:
+    import ujson
+    json_backends['ujson'] = ujson.loads
+except ImportError:
+    pass
+try:
+    import simplejson
+    json_backends['simplejson'] = simplejson.loads
+except ImportError:
+    pass
+json_modes = sorted(json_backends.keys()) + ['scan']
+
+# Q11651459 is the disambiguation type
+# Q4167410 is an article about disambiguation pages that
+# is mistakenly used to flag disambiguation pages.
+disambiguation_ids = [4167410, 11651459]
+disambiguation_strings = [str(x) for x in disambiguation_ids]
+links_key = '"links":'
+scan_decoder = json.JSONDecoder()
+
+def decode_page(text):
+    '''Returns the sitelinks and disambiguation flag from a page's json.'''
+    if json_mode == 'scan':
+        return scan_page(text)
+    data = json_backends[json_mode](text)
+    return data.get('links'), claims_disambiguation(data)
+
+def scan_page(text):
+    '''Decodes only the parts of a page's json needed for language links.'''
+    for s in disambiguation_strings:
+        if s in text:
+            # Possibly a disambiguation page, decode everything
+            data = json.loads(text)
+            return data.get('links'), claims_disambiguation(data)
+    i = text.find(links_key)
+    if i < 0:
+        return None, 0
+    i += len(links_key)
+    while text[i].isspace():
+        i += 1
+    links, end = scan_decoder.raw_decode(text, i)
+    return links, 0
+
+def claims_disambiguation(data):
+    '''Returns 1 if the claims of a decoded page mark a disambiguation page.'''
+    for claim in data.get('claims', []):
+        try:
+            if claim['m'][1] == 107:
+                if claim['m'][3]['numeric-id'] in disambiguation_ids:
+                    return 1
+        except KeyError:
+            pass
+        except IndexError:
+            pass
+    return 0
+
+def parse_page(entity, text):
+    '''Returns the entity record and language link objects for a wikidata page.
+
+    The entity record is None when the page has no language links.
+    '''
+    sitelinks, disambiguation = decode_page(text)
+    return page_links(entity, sitelinks, disambiguation)
+
+def page_links(entity, sitelinks, disambiguation):
+    '''Returns the entity record and language link objects for decoded sitelinks.'''
+    links = []
+    try:
+        for language, title in sitelinks.items():
+            # Change 'enwiki' to 'en'
+            language_code = language[:-4]
+            links.append({
+                'entity':entity
+                , 'language':language_code
+                , 'title':title
+                , 'disambiguation':disambiguation})
+    except KeyError:
+        pass
+    except AttributeError:
+        pass
+    if len(links) == 0:
+        return None, links
+    # Store the number of sitelinks with each link so that singletons can be
+    # found with a single lookup on (language, title)
+    for link in links:
+        link['sitelinks'] = len(links)
+    record = {
+        'entity':entity
+        , 'sitelinks':len(links)
+        , 'languages':[link['language'] for link in links]
+        , 'disambiguation':disambiguation}
+    return record, links
+
+def run_worker(worker, *args):
+    '''Runs a worker process, reporting any exception on done_q (its last argument).
+
+    The main process stops the run when it sees the report, rather than
+    waiting forever on queues the failed worker no longer serves.
+    '''
+    done_q = args[-1]
+    try:
+        worker(*args)
+    except:
+        done_q.put(('error', multiprocessing.current_process().name
+            , traceback.format_exc()))
+        sys.exit(1)
+
+def page_process(page_q, link_q, link_batch_size, done_q):
+    '''Worker process: turns chunks of pages into batches of links.
+
+    Each batch lists the sequence numbers of the chunks it contains, so that
+    the main process knows when a chunk has been written.
+    '''
+    entities = []
+    batch = []
+    seqs = []
+    # Number of pages and seconds spent decoding them, for the metrics
+    decoded = [0, 0.0]
+    while True:
+        chunk = page_q.get()
+        if chunk is None:
+            break
+        seq, pages = chunk
+        start = time.time()
+        for entity, text in pages:
+            record, links = parse_page(entity, text)
+            if record:
+                entities.append(record)
+                batch.extend(links)
+        decoded[0] += len(pages)
+        decoded[1] += time.time() - start
+        seqs.append(seq)
+        if len(batch) >= link_batch_size:
+            link_q.put((entities, batch, seqs, decoded))
+            entities = []
+            batch = []
+            seqs = []
+            decoded = [0, 0.0]
+    if len(seqs) > 0:
+        link_q.put((entities, batch, seqs, decoded))
+
+def link_process(link_q, dry_run, index_path, done_q):
+    '''Worker process: inserts batches of links into the database.'''
+    wikidata = Wikidata(dry_run=dry_run, index_path=index_path)
+    while True:
+        batch = link_q.get()
+        if batch is None:
+            break
+        entities, links, seqs, decoded = batch
+        start = time.time()
+        wikidata.insert_links(entities, links)
+        done_q.put(('written', len(links), seqs, decoded, time.time() - start))
+    wikidata.close()
+
 class Wikidata:
     """Loads wikidata from an xml dump and adds it to a database."""
     
-    def __init__(self):
+    def __init__(self, pages_path=pages, dry_run=False, index_path=None
+        , checkpoint_path=None, metrics_path=None):
         """Initialize the parsing process."""
+        self.pages_path = pages_path
+        # Progress is saved to checkpoint_path, see save_checkpoint()
+        self.checkpoint_path = checkpoint_path
+        if self.checkpoint_path is None:
+            self.checkpoint_path = pages_path + '.checkpoint'
+        self.checkpoint_time = time.time()
+        # Position of the last page written before the checkpoint resumed
+        # from, see resume()
+        self.resume_position = None
+        # Position of the last page given to process_page()
+        self.page_position = None
+        # With dry_run set pages are parsed but nothing is written
+        self.dry_run = dry_run
+        # With index_path set links are written to an index file instead of
+        # the database, see linkindex.py
+        self.index_path = index_path
+        self.index = None
+        # Stage timings and queue depths, written to metrics_path if given
+        self.metrics = Metrics('linkdata', metrics_path
+            , labels={'dump':os.path.basename(pages_path)})
+        self.write_stage = 'index' if self.index_path else 'db'
         # Connect to database
-        self.mcon = pymongo.Connection('localhost')
-        self.mdb = self.mcon.singletons
+        self.writer = None
+        if not self.dry_run and not self.index_path:
+            self.connect()
         # Create queues for raw page data and processed link objects
         self.page_q = Queue(500)
         self.link_q = Queue(50)
@@ -41,14 +267,131 @@ class Wikidata:
         self.page_count = 0;
         self.link_count = 0;
         # Buffers for batching insertions
-        # 500k seems to give the best performance but causes the server to
-        # disconnect
         self.link_batch = []
-        self.link_batch_size = 250000
-        
+        self.link_batch_size = link_batch_size
+        self.entity_batch = []
+        # Worker processes, see start_processes()
+        self.page_procs = []
+        self.link_procs = []
+        self.page_chunk = []
+        # Sequence numbers and positions of chunks sent to the page processes
+        self.chunk_seq = 0
+        self.chunk_positions = {}
+        self.chunks_done = set()
+        self.chunks_written = 0
+        self.metrics.gauge('pages', lambda: self.page_count)
+        self.metrics.gauge('links', lambda: self.link_count)
+        self.metrics.gauge('page_queue', lambda: self.page_q.qsize())
+        self.metrics.gauge('link_queue', lambda: self.link_q.qsize())
+    
+    def connect(self):
+        """Connects to the database."""
+        self.mcon = pymongo.Connection(db_host)
+        self.mdb = self.mcon[db_name]
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = BulkWriter(self.mdb, compact, metrics=self.metrics)
+    
+    def create_unique_indexes(self):
+        """Creates the indexes that upserts are keyed on."""
+        # Documents of both shapes in one collection can't be read back
+        if self.mdb.langlinks.find_one() is not None and stored_compact(self.mdb) != compact:
+            raise ValueError('Existing language links are stored %s compact documents'
+                % ('as' if stored_compact(self.mdb) else 'without'))
+        self.mdb.meta.save({'_id':'langlinks', 'compact':compact})
+        print "Creating unique index on: (entity, language)"
+        self.mdb.langlinks.ensure_index([(field('entity', compact), pymongo.ASCENDING), (field('language', compact), pymongo.ASCENDING)], unique=True)
+        print "Creating unique index on: entities.entity"
+        self.mdb.entities.ensure_index(field('entity', compact), unique=True)
+    
+    def resume(self):
+        """Continues from the last checkpoint, if there is one."""
+        if not os.path.exists(self.checkpoint_path):
+            print "No checkpoint found, starting from the beginning"
+            return
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        # Offsets into another dump (e.g. a newer download under the same
+        # name) would skip pages
+        if checkpoint.get('dump') != self.dump_stat():
+            raise ValueError('%s was saved for another version of %s, remove it to start over'
+                % (self.checkpoint_path, self.pages_path))
+        self.resume_position = DumpPosition(checkpoint['offset'], checkpoint['tell']
+            , checkpoint['page_count'], checkpoint['title'])
+        self.page_count = checkpoint['page_count']
+        self.link_count = checkpoint['link_count']
+        print "Resuming at offset %d (%d pages)" % (self.resume_position.offset, self.page_count)
+    
+    def dump_stat(self):
+        """Returns the size and modification time of the dump."""
+        stat = os.stat(self.pages_path)
+        return {'size':stat.st_size, 'mtime':int(stat.st_mtime)}
+    
+    def save_checkpoint(self, position):
+        """Saves the position of a page written along with all pages before it."""
+        if self.dry_run or self.index_path or position is None:
+            return
+        if time.time() - self.checkpoint_time < checkpoint_interval:
+            return
+        self.checkpoint_time = time.time()
+        checkpoint = {
+            'pages':self.pages_path
+            , 'dump':self.dump_stat()
+            , 'offset':position.offset
+            , 'tell':position.tell
+            , 'page_count':position.page_count
+            , 'title':position.title
+            , 'link_count':self.link_count
+            , 'time':self.checkpoint_time}
+        # Replace the checkpoint atomically so a crash can't corrupt it
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.rename(tmp_path, self.checkpoint_path)
+    
+    def remove_checkpoint(self):
+        """Removes the checkpoint once the whole dump has been written."""
+        # Index and dry runs don't write checkpoints, the one there belongs
+        # to a database run
+        if self.dry_run or self.index_path:
+            return
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+    
+    def unwritten_pages(self, dump):
+        """Yields (page, position) for the pages of the dump not written yet.
+
+        Resuming starts at the first page after the checkpointed offset, which
+        may come before the last page written.  Pages are held back until that
+        page is found, or until the reader is past where it ended.
+        """
+        held = None
+        if self.resume_position is not None:
+            held = []
+        for page in read_pages(dump):
+            position = DumpPosition(resume_offset(dump), dump.tell()
+                , self.page_count + 1 + len(held or []), page.title)
+            if held is None:
+                yield page, position
+                continue
+            held.append((page, position))
+            if page.title == self.resume_position.title:
+                # Written before the checkpoint
+                held = None
+            elif dump.tell() > self.resume_position.tell + feed_size:
+                for item in held:
+                    yield item
+                held = None
+        for item in held or []:
+            yield item
+    
     def process_linkdata(self):
         """Parses the wikidata xml."""
+        if not self.dry_run and not self.index_path:
+            self.create_unique_indexes()
         # Create task queue and worker threads
+        if page_processes > 0:
+            self.start_processes()
         if page_thread:
             t = Thread(target=self.page_worker)
             t.daemon = True
@@ -57,108 +400,203 @@ class Wikidata:
             t = Thread(target=self.link_worker)
             t.daemon = True
             t.start()
-        # Create iterator and get root element
-        context = iterparse(pages, events=('start', 'end'))
-        event, root = context.next()
+        offset = 0
+        if self.resume_position is not None:
+            offset = self.resume_position.offset
+        dump = open_dump(self.pages_path, offset)
+        parse_start = time.time()
         # Iterate through pages
-        for event, elem in context:
-            if (event != 'end'):
-                continue
-            if elem.tag == "%stitle" % (prefix):
-                entity = elem.text
-            if elem.tag == "%sns" % (prefix):
-                namespace = elem.text
-            if elem.tag == "%stext" % (prefix):
-                text = elem.text
-            if elem.tag == "%spage" % (prefix):
-                self.page_count += 1
-                # We only want regular articles (namespace 0) not talk, categories, etc.
-                if namespace == '0':
-                    # Wikidata texts are sent to worker threads in batches so that
-                    # json parsing etc. can be done while the xml parser is reading
-                    # from disk.
-                    if page_thread:
-                        self.page_q.put((entity, text))
-                    else:
-                        self.process_page(entity, text)
-                entity = text = ''
-                ns = -3
-                # Clear all parsed elements from RAM
-                root.clear()
+        for page, position in self.unwritten_pages(dump):
+            self.metrics.add_time('parse', time.time() - parse_start)
+            self.page_count += 1
+            # We only want regular articles (namespace 0) not talk, categories, etc.
+            if page.ns == '0' and page.text is not None:
+                # Wikidata texts are sent to worker threads in batches so that
+                # json parsing etc. can be done while the xml parser is reading
+                # from disk.
+                if page_processes > 0:
+                    self.put_page_process(page.title, page.text, position)
+                elif page_thread:
+                    self.page_q.put((page.title, page.text, position))
+                else:
+                    self.process_page(page.title, page.text, position)
+            parse_start = time.time()
+        dump.close()
         # Process any links left in the buffer
-        self.flush_links()
+        if page_processes > 0:
+            self.stop_processes()
+        else:
+            self.flush_links()
         # Wait for worker threads to complete
         if page_thread:
             self.page_q.join()
         if link_thread:
             self.link_q.join()
+        # A later run over a new dump must not resume from this one
+        self.remove_checkpoint()
+        self.print_stats()
+        start = time.time()
+        self.close()
+        if self.index_path:
+            self.metrics.add_time('create_index', time.time() - start)
+            self.metrics.summary()
+            print "Index complete"
+            return
+        if self.dry_run:
+            self.metrics.summary()
+            return
         print "Insertion complete"
-        print "Creating index on: entity"
-        self.mdb.langlinks.create_index('entity')
+        # The entity index is the prefix of the unique (entity, language) index
         print "Creating index on: (language, title)"
-        self.mdb.langlinks.create_index([('language', pymongo.ASCENDING), ('title', pymongo.ASCENDING)])
+        self.mdb.langlinks.create_index([(field('language', compact), pymongo.ASCENDING), (field('title', compact), pymongo.ASCENDING)])
+        print "Creating index on: entities.sitelinks"
+        self.mdb.entities.create_index(field('sitelinks', compact))
+        self.metrics.add_time('create_index', time.time() - start)
+        self.metrics.summary()
     
     def page_worker(self):
         '''Processes a page from the queue.'''
         # Process pages until there are none left
         while True:
             # Get a page json string from the queue
-            (entity, text) = self.page_q.get()
-            self.process_page(entity, text)
+            (entity, text, position) = self.page_q.get()
+            self.process_page(entity, text, position)
             self.page_q.task_done()
     
-    def process_page(self, entity, text):
+    def process_page(self, entity, text, position=None):
         '''Creates language links for a page and adds them to a buffer.'''
-        # Batch processed objects
-        data = json.loads(text)
-        # Flag disambiguation pages
-        disambiguation = 0
-        for claim in data.setdefault('claims', []):
+        self.page_position = position
+        start = time.time()
+        record, links = parse_page(entity, text)
+        self.metrics.add_time('decode', time.time() - start)
+        if record:
+            self.entity_batch.append(record)
+            self.link_batch.extend(links)
+        if len(self.link_batch) >= self.link_batch_size:
+            self.flush_links()
+    
+    def start_processes(self):
+        '''Starts the page and link worker processes.'''
+        # Replace the thread queues with process queues
+        self.page_q = multiprocessing.Queue(2 * page_processes)
+        self.link_q = multiprocessing.Queue(2 * link_processes)
+        # Link processes report the number of links written on done_q, and
+        # any process reports its failure there
+        self.done_q = multiprocessing.Queue()
+        for i in range(page_processes):
+            p = multiprocessing.Process(target=run_worker
+                , args=(page_process, self.page_q, self.link_q, self.link_batch_size, self.done_q))
+            p.start()
+            self.page_procs.append(p)
+        for i in range(link_processes):
+            p = multiprocessing.Process(target=run_worker
+                , args=(link_process, self.link_q, self.dry_run, self.index_path, self.done_q))
+            p.start()
+            self.link_procs.append(p)
+    
+    def put_page_process(self, entity, text, position):
+        '''Buffers a page and sends full chunks to the page processes.'''
+        self.page_chunk.append((entity, text))
+        self.page_position = position
+        if len(self.page_chunk) >= page_chunk_size:
+            self.put_page_chunk()
+            self.poll_processes()
+    
+    def put_page_chunk(self):
+        '''Sends the buffered pages to the page processes.'''
+        self.chunk_positions[self.chunk_seq] = self.page_position
+        self.put_process_queue(self.page_q, (self.chunk_seq, self.page_chunk))
+        self.chunk_seq += 1
+        self.page_chunk = []
+    
+    def put_process_queue(self, q, item):
+        '''Puts an item on a process queue, checking on the processes while it is full.'''
+        while True:
             try:
-                if claim['m'][1] == 107:
-                    # Q11651459 is the disambiguation type
-                    # Q4167410 is an article about disambiguation pages that
-                    # is mistakenly used to flag disambiguation pages.
-                    if claim['m'][3]['numeric-id'] in [4167410, 11651459]:
-                        disambiguation = 1
-                        break
-            except KeyError:
-                pass
-            except IndexError:
-                pass
-        try:
-            titles = []
-            for language, title in data['links'].items():
-                # Create a json object to save to the db later
-                #print("%s : %s : %s" % (title, key, value))
-                # Change 'enwiki' to 'en'
-                language_code = language[:-4]
-                titles.append(u'%s:%s' % (language_code, title))
-                self.link_batch.append({
-                    'entity':entity
-                    , 'language':language_code
-                    , 'title':title
-                    , 'disambiguation':disambiguation})
-                if len(self.link_batch) >= self.link_batch_size:
-                    self.flush_links()
-        except KeyError:
-            pass
-        except AttributeError:
-            pass
+                q.put(item, timeout=1)
+                return
+            except Full:
+                self.poll_processes()
+    
+    def join_processes(self, procs):
+        '''Waits for processes to finish, checking on all of them meanwhile.'''
+        for p in procs:
+            while p.is_alive():
+                self.poll_processes()
+                p.join(0.1)
+        self.poll_processes()
+    
+    def poll_processes(self):
+        '''Collects link counts reported by the link processes.
+
+        Exits if a process failed.
+        '''
+        while not self.done_q.empty():
+            message = self.done_q.get()
+            if message[0] == 'error':
+                name, error = message[1:]
+                self.stop_on_error('%s failed:\n%s' % (name, error))
+            count, seqs, decoded, seconds = message[1:]
+            self.link_count += count
+            self.metrics.add_time('decode', decoded[1], calls=decoded[0])
+            self.metrics.add_time(self.write_stage, seconds)
+            self.chunks_done.update(seqs)
+            self.print_stats()
+        # Chunks are written out of order, only checkpoint the position after
+        # the last of a run of written chunks
+        position = None
+        while self.chunks_written in self.chunks_done:
+            self.chunks_done.remove(self.chunks_written)
+            position = self.chunk_positions.pop(self.chunks_written)
+            self.chunks_written += 1
+        self.save_checkpoint(position)
+        # A process killed outright (e.g. out of memory) can't report itself
+        for p in self.page_procs + self.link_procs:
+            if p.exitcode:
+                self.stop_on_error('%s exited with code %d' % (p.name, p.exitcode))
+    
+    def stop_on_error(self, message):
+        '''Stops all processes and exits after a worker process failed.
+
+        The last checkpoint is kept, so the run can be continued with --resume.
+        '''
+        print message
+        for p in self.page_procs + self.link_procs:
+            if p.is_alive():
+                p.terminate()
+        # Items left on the queues can't be flushed to dead processes
+        for q in [self.page_q, self.link_q, self.done_q]:
+            q.cancel_join_thread()
+        sys.exit(1)
+    
+    def stop_processes(self):
+        '''Sends the remaining pages and waits for all processes to finish.'''
+        if len(self.page_chunk) > 0:
+            self.put_page_chunk()
+        # Page processes flush their last batch when they see None
+        for p in self.page_procs:
+            self.put_process_queue(self.page_q, None)
+        self.join_processes(self.page_procs)
+        for p in self.link_procs:
+            self.put_process_queue(self.link_q, None)
+        # Collect counts while the link processes drain the queue
+        self.join_processes(self.link_procs)
     
     def flush_links(self):
         '''Moves all buffered links into the insertion queue.'''
         if link_thread:
-            self.link_q.put(self.link_batch)
+            self.link_q.put((self.entity_batch, self.link_batch, self.page_position))
         else:
-            self.process_links_mongo(self.link_batch)
+            self.process_links_mongo(self.entity_batch, self.link_batch, self.page_position)
+        self.entity_batch = []
         self.link_batch = []
     
     def link_worker(self):
         '''Processes links from the insertion queue.'''
         # Process links until there are none left
         while True:
-            self.process_links_mongo(self.link_q.get())
+            entities, links, position = self.link_q.get()
+            self.process_links_mongo(entities, links, position)
             self.link_q.task_done()
     
     def process_link_redis(self, link):
@@ -167,21 +605,46 @@ class Wikidata:
         self.rdb.set(u'title:%s' % title, link['entity'])
         self.rdb.sadd(u'entity:%s' % (link['entity']), title)
     
-    def process_links_mongo(self, link):
+    def process_links_mongo(self, entities, link, position):
         '''Adds a link to a mongo database.'''
-        while True:
-            try:
-                self.mdb.langlinks.insert(link)
-                break
-            except pymongo.errors.AutoReconnect:
-                # Reconnect and retry.  This may add duplicates but we'll
-                # create a unique index when we have finished.
-                print "Caught AutoReconnect, reconnecting..."
-                self.mcon = pymongo.Connection('localhost')
-                self.mdb = self.mcon.singletons
-                print "Reconnected"
+        start = time.time()
+        self.insert_links(entities, link)
+        self.metrics.add_time(self.write_stage, time.time() - start)
         self.link_count += len(link)
         self.print_stats()
+        self.save_checkpoint(position)
+    
+    def insert_links(self, entities, link):
+        '''Inserts a batch of entities and links, waiting until they are written.'''
+        if self.dry_run:
+            return
+        if self.index_path:
+            self.index_links(link)
+            return
+        # Dropped connections are retried by the writer
+        self.writer.upsert('entities', entities, ['entity'])
+        self.writer.upsert('langlinks', link, ['entity', 'language'])
+        self.writer.wait()
+    
+    def index_links(self, link):
+        '''Adds a batch of links to the index file.'''
+        if self.index is None:
+            self.index = LinkIndexWriter(self.index_path)
+        for x in link:
+            self.index.add(x['language'], x['title'], x['sitelinks'], x['disambiguation'])
+    
+    def close_index(self):
+        '''Writes out the index file, if any.'''
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+    
+    def close(self):
+        '''Finishes writing links to the index file or database.'''
+        self.close_index()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
     
     def print_stats(self):
         '''Prints progress and performance info.'''
@@ -189,7 +652,56 @@ class Wikidata:
         pps = self.page_count / elapsed
         lps = self.link_count / elapsed
         print "Pages: %dk(%d/s), Links: %dk(%d/s) PageQ:%d LinkQ:%d" % (self.page_count/1000, int(pps), self.link_count/1000, int(lps), self.page_q.qsize(), self.link_q.qsize())
+        self.metrics.maybe_report()
 
-# Run the script
-wikidata = Wikidata()
-wikidata.process_linkdata()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load wikidata language links into the database.')
+    parser.add_argument('pages', nargs='?', default=pages
+        , help='path to the wikidata xml dump')
+    parser.add_argument('--page-processes', type=int, default=page_processes
+        , help='number of page decoding processes (0 to decode in this process)')
+    parser.add_argument('--link-processes', type=int, default=link_processes
+        , help='number of database insertion processes')
+    parser.add_argument('--dry-run', action='store_true'
+        , help='parse the dump without writing to the database')
+    parser.add_argument('--index', metavar='PATH'
+        , help='write links to an index file instead of the database')
+    parser.add_argument('--json', choices=json_modes, default=json_mode
+        , help='how page json is decoded')
+    parser.add_argument('--compact', action='store_true'
+        , help='store links with short field names and language ids')
+    parser.add_argument('--writer-threads', type=int, default=bulkwriter.writer_threads
+        , help='number of bulk writes in flight per link process')
+    parser.add_argument('--checkpoint', metavar='PATH'
+        , help='checkpoint file (default: the dump path + .checkpoint)')
+    parser.add_argument('--resume', action='store_true'
+        , help='continue from the last checkpoint instead of the beginning')
+    parser.add_argument('--metrics', metavar='PATH'
+        , help='write metrics as json lines, or in the Prometheus text format if PATH ends in .prom')
+    parser.add_argument('--metrics-interval', type=int, default=metrics.report_interval
+        , help='seconds between metrics reports')
+    parser.add_argument('--profile', metavar='PATH'
+        , help='profile the main process with cProfile and save the stats to PATH')
+    args = parser.parse_args()
+    if args.resume and (args.index or args.dry_run):
+        # Checkpoints are only saved by database runs
+        parser.error('--resume can only be used when writing to the database')
+    metrics.report_interval = args.metrics_interval
+    json_mode = args.json
+    compact = args.compact
+    bulkwriter.writer_threads = args.writer_threads
+    page_processes = args.page_processes
+    link_processes = max(1, args.link_processes)
+    if args.index:
+        # The index file has a single writer
+        link_processes = 1
+    # Run the script
+    if args.profile:
+        profile = start_profile()
+    wikidata = Wikidata(args.pages, dry_run=args.dry_run, index_path=args.index
+        , checkpoint_path=args.checkpoint, metrics_path=args.metrics)
+    if args.resume:
+        wikidata.resume()
+    wikidata.process_linkdata()
+    if args.profile:
+        stop_profile(profile, args.profile)
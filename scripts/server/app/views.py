@@ -1,19 +1,144 @@
-from flask import render_template, request
+from flask import render_template, request, Response, abort
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
 from app import app, db
 from forms import PagerForm
 import re
+import json
+import hashlib
+
+# Bytes of json lines sent per chunk by the streaming api
+stream_chunk_size = 64 * 1024
+# Pages the streaming api asks mongod for at a time, enough to fill a few
+# chunks per round trip
+stream_batch_size = 5000
+
+# Page counts and languages are cached until the ingest marks the pages
+# collection as updated
+cache = {'updated': None, 'counts': {}, 'languages': None}
+
+def check_cache():
+    meta = db.meta.find_one({'_id': 'pages'})
+    updated = meta['updated'] if meta else None
+    if updated != cache['updated'] or updated is None:
+        cache['updated'] = updated
+        cache['counts'] = {}
+        cache['languages'] = None
+
+def count_pages(language):
+    if language not in cache['counts']:
+        cache['counts'][language] = db.pages.find({'language': language}).count()
+    return cache['counts'][language]
+
+def page_languages():
+    if cache['languages'] is None:
+        cache['languages'] = sorted(db.pages.distinct('language'))
+    return cache['languages']
+
+def parse_id(s):
+    if ObjectId.is_valid(s):
+        return ObjectId(s)
+    return None
 
 @app.route('/', methods=['GET'])
 @app.route('/index', methods=['GET'])
 def index():
+    check_cache()
     per_page = int(request.args.get('per_page', 25))
     start = int(request.args.get('start', '0'))
-    if request.args.get('submit', '') == 'First':
+    language = request.args.get('language', 'es')
+    # Pages are fetched relative to the _id of the first or last article
+    # shown, so deep pages cost the same as the first one
+    first = parse_id(request.args.get('first', ''))
+    last = parse_id(request.args.get('last', ''))
+    submit = request.args.get('submit', '')
+    query = {'language': language}
+    order = ASCENDING
+    if language != request.args.get('shown_language', language) or submit == 'First':
         start = 0
-    if request.args.get('submit', '') == 'Prev':
+    elif submit == 'Prev' and first:
         start = max(0, start - per_page)
-    elif request.args.get('submit', '') == 'Next':
+        query['_id'] = {'$lt': first}
+        order = DESCENDING
+    elif submit == 'Next' and last:
         start = start + per_page
-    end = start + per_page - 1
-    pages = [(x['title'], re.sub(r' ', '_', x['title'])) for x in db.pages.find(skip=start, limit=per_page)]
-    return render_template("index.html", start=start, end=end, per_page=per_page, total=db.pages.count(), pages=pages)
+        query['_id'] = {'$gt': last}
+    elif first:
+        query['_id'] = {'$gte': first}
+    results = list(db.pages.find(query).sort('_id', order).limit(per_page))
+    if not results and submit == 'Next' and first:
+        # Past the end, show the last page again
+        start = start - per_page
+        query['_id'] = {'$gte': first}
+        results = list(db.pages.find(query).sort('_id', ASCENDING).limit(per_page))
+    elif not results and submit == 'Prev':
+        # Before the start, show the first page
+        start = 0
+        query.pop('_id', None)
+        order = ASCENDING
+        results = list(db.pages.find(query).sort('_id', ASCENDING).limit(per_page))
+    if order == DESCENDING:
+        results.reverse()
+    end = start + len(results) - 1
+    pages = [(x['title'], re.sub(r' ', '_', x['title'])) for x in results]
+    first = results[0]['_id'] if results else ''
+    last = results[-1]['_id'] if results else ''
+    return render_template("index.html", start=start, end=end, per_page=per_page
+        , total=count_pages(language), pages=pages, language=language
+        , languages=page_languages(), domain=language.replace('_', '-')
+        , first=first, last=last)
+
+def pages_signature(language):
+    # Changes whenever pages are added or removed, including while an ingest
+    # is still running and hasn't marked the collection as updated
+    query = {'language': language} if language else {}
+    newest = list(db.pages.find(query, fields=['_id']).sort('_id', DESCENDING).limit(1))
+    return (db.pages.find(query).count(), newest[0]['_id'] if newest else None)
+
+def api_etag(updated, *args):
+    key = repr((updated,) + args)
+    return hashlib.sha1(key).hexdigest()
+
+def stream_pages(cursor):
+    # Lines are sent in chunks rather than one write per page
+    chunk = []
+    size = 0
+    for page in cursor:
+        line = json.dumps({'id': str(page['_id']), 'language': page['language']
+            , 'title': page['title']}) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= stream_chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+@app.route('/api/singletons', methods=['GET'])
+def api_singletons():
+    # Streams all matching singletons as json lines in _id order.  Clients
+    # resume an interrupted transfer, or fetch what was added since their
+    # last one, by passing the id of the last line they got as 'since'.
+    check_cache()
+    language = request.args.get('language', '')
+    since = request.args.get('since', '')
+    limit = request.args.get('limit', '0')
+    if not limit.isdigit() or (since and not parse_id(since)):
+        abort(400)
+    limit = int(limit)
+    query = {}
+    if language:
+        query['language'] = language
+    if since:
+        query['_id'] = {'$gt': parse_id(since)}
+    etag = api_etag(cache['updated'], pages_signature(language), language, since, limit)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    cursor = db.pages.find(query, fields=['language', 'title']).sort('_id', ASCENDING)
+    cursor = cursor.batch_size(stream_batch_size).limit(limit)
+    response = Response(stream_pages(cursor), mimetype='application/x-ndjson')
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,163 @@
+# Cultural Singletons
+# Generate synthetic XML dumps for testing and benchmarking
+# Edward L. Platt <elplatt@mit.edu>
+# MIT Center for Civic Media
+
+# Standard imports
+import json
+import random
+from xml.sax.saxutils import escape
+
+# XML Config
+prefix_uri = 'http://www.mediawiki.org/xml/export-0.8/'
+
+# Wiki languages used for synthetic language links
+languages = ['en', 'es', 'de', 'fr', 'it', 'pt', 'ru', 'ja', 'zh', 'pl', 'nl'
+    , 'sv', 'ca', 'uk', 'fi', 'no', 'cs', 'hu', 'ko', 'id', 'tr', 'ro', 'fa'
+    , 'ar', 'da', 'eo', 'sr', 'lt', 'sk', 'ms', 'he', 'bg', 'vi', 'kk', 'eu']
+
+header = '''<mediawiki xmlns="%s" version="0.8" xml:lang="%s">
+  <siteinfo>
+    <sitename>%s</sitename>
+    <base>http://%s.wikipedia.org/wiki/Main_Page</base>
+    <generator>MediaWiki 1.22wmf12</generator>
+    <case>first-letter</case>
+  </siteinfo>
+'''
+
+page_template = '''  <page>
+    <title>%s</title>
+    <ns>%s</ns>
+    <id>%d</id>
+%s    <revision>
+      <id>%d</id>
+      <timestamp>2013-08-01T00:00:00Z</timestamp>
+      <contributor>
+        <username>Synthetic</username>
+        <id>1</id>
+      </contributor>
+      <model>%s</model>
+      <format>%s</format>
+      <text xml:space="preserve" bytes="%d">%s</text>
+      <sha1>0</sha1>
+    </revision>
+  </page>
+'''
+
+footer = '</mediawiki>\n'
+
+def random_title(rnd):
+    '''Returns a random article title.'''
+    words = ['Lorem', 'Ipsum', 'Dolor', 'Sit', 'Amet', u'R\xedo'
+        , 'Ciudad', u'Stra\xdfe', 'Batalla', 'Museo', 'Rey']
+    return u' '.join(rnd.choice(words) for i in range(rnd.randint(1, 3))) \
+        + u' %d' % rnd.randint(0, 1000000)
+
+def write_page(f, title, ns, page_id, text, model, redirect=None):
+    '''Writes a single page element.'''
+    if redirect:
+        redirect = u'    <redirect title="%s" />\n' % escape(redirect, {'"': '&quot;'})
+    else:
+        redirect = u''
+    text = escape(text)
+    xml = page_template % (escape(title), ns, page_id, redirect, page_id
+        , model, 'application/json' if model == 'wikibase-item' else 'text/x-wiki'
+        , len(text), text)
+    f.write(xml.encode('utf8'))
+
+def wikidata_text(rnd, entity, links, disambiguation_rate):
+    '''Returns the json text of a synthetic wikidata entity.'''
+    sitelinks = {}
+    for language in rnd.sample(languages, min(links, len(languages))):
+        sitelinks['%swiki' % language] = random_title(rnd)
+    claims = []
+    for i in range(rnd.randint(0, 6)):
+        claims.append({'m': ['value', rnd.randint(1, 1000), 'wikibase-entityid'
+            , {'entity-type': 'item', 'numeric-id': rnd.randint(1, 10000000)}]
+            , 'q': [], 'g': '%s$%d' % (entity, i), 'rank': 1, 'refs': []})
+    if rnd.random() < disambiguation_rate:
+        claims.append({'m': ['value', 107, 'wikibase-entityid'
+            , {'entity-type': 'item', 'numeric-id': 11651459}]
+            , 'q': [], 'g': '%s$d' % entity, 'rank': 1, 'refs': []})
+    data = {'label': {'en': random_title(rnd)}, 'description': {'en': 'Synthetic item'}
+        , 'aliases': {}, 'links': sitelinks, 'entity': entity.lower()
+        , 'claims': claims}
+    return json.dumps(data, separators=(',', ':'))
+
+def write_wikidata_dump(path, page_count, max_links=20, disambiguation_rate=0.02, seed=0):
+    '''Writes a synthetic wikidatawiki pages-articles dump.'''
+    rnd = random.Random(seed)
+    with open(path, 'wb') as f:
+        f.write(header % (prefix_uri, 'en', 'Wikidata', 'www.wikidata'))
+        for i in range(page_count):
+            entity = u'Q%d' % (i + 1)
+            # Most items have few links, a few have many
+            links = min(max_links, int(rnd.expovariate(1.0 / 4)) + 1)
+            text = wikidata_text(rnd, entity, links, disambiguation_rate)
+            write_page(f, entity, 0, i + 1, text, 'wikibase-item')
+        f.write(footer)
+
+# Wikitext building blocks for synthetic articles
+templates = [u'Ficha de persona', u'Cita web', u'Referencias', u'Commonscat'
+    , u'Infobox settlement', u'Cita libro', u'Ap', u'VT', u'Control de autoridades'
+    , u'Esbozo de geograf\xeda', u'Otros usos', u'Coord']
+disambiguation_templates = [u'Desambiguaci\xf3n', u'desambiguaci\xf3n', u'Des', u'Dab']
+words = [u'el', u'la', u'de', u'que', u'en', u'los', u'r\xedo', u'ciudad', u'a\xf1o'
+    , u'historia', u'poblaci\xf3n', u'nacional', u'municipio', u'guerra']
+
+def wikipedia_text(rnd, length, disambiguation_rate, language_link_rate):
+    '''Returns the wikitext of a synthetic article.'''
+    parts = [u'{{%s|nombre=%s|imagen=Foto.jpg}}\n' % (rnd.choice(templates), random_title(rnd))]
+    if rnd.random() < disambiguation_rate:
+        parts.append(u'{{%s}}\n' % rnd.choice(disambiguation_templates))
+    size = 0
+    while size < length:
+        r = rnd.random()
+        if r < 0.08:
+            part = u'[[%s]] ' % random_title(rnd)
+        elif r < 0.1:
+            part = u'[[%s|%s]] ' % (random_title(rnd), rnd.choice(words))
+        elif r < 0.11:
+            part = u'{{%s|%s}} ' % (rnd.choice(templates), rnd.choice(words))
+        elif r < 0.115:
+            part = u'[[Archivo:%s.jpg|thumb|%s]] ' % (random_title(rnd), rnd.choice(words))
+        else:
+            part = rnd.choice(words) + u' '
+        parts.append(part)
+        size += len(part)
+    parts.append(u'\n[[Categor\xeda:%s]]\n' % random_title(rnd))
+    if rnd.random() < language_link_rate:
+        for language in rnd.sample(languages, rnd.randint(1, 5)):
+            parts.append(u'[[%s:%s]]\n' % (language, random_title(rnd)))
+    return u''.join(parts)
+
+def write_wikipedia_dump(path, page_count, language='es', mean_length=3000
+    , disambiguation_rate=0.03, language_link_rate=0.05, redirect_rate=0.2
+    , titles=None, seed=0):
+    '''Writes a synthetic wikipedia pages-articles dump.
+
+    If titles is given, those titles are used for the first articles so that
+    they match language links of a synthetic wikidata dump.
+    '''
+    rnd = random.Random(seed)
+    if titles is None:
+        titles = []
+    with open(path, 'wb') as f:
+        f.write(header % (prefix_uri, language, 'Wikipedia', language))
+        for i in range(page_count):
+            if i < len(titles):
+                title = titles[i]
+            else:
+                title = random_title(rnd)
+            r = rnd.random()
+            if r < redirect_rate:
+                target = random_title(rnd)
+                write_page(f, title, 0, i + 1, u'#REDIRECCI\xd3N [[%s]]' % target
+                    , 'wikitext', redirect=target)
+            elif r < redirect_rate + 0.05:
+                write_page(f, u'Discusi\xf3n:%s' % title, 1, i + 1, u'Comentario ~~~~', 'wikitext')
+            else:
+                length = int(rnd.expovariate(1.0 / mean_length))
+                text = wikipedia_text(rnd, length, disambiguation_rate, language_link_rate)
+                write_page(f, title, 0, i + 1, text, 'wikitext')
+        f.write(footer)